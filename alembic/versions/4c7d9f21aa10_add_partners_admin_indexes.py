@@ -0,0 +1,38 @@
+"""add partners admin indexes
+
+Revision ID: 4c7d9f21aa10
+Revises: 9497449e48ad
+Create Date: 2026-08-26 09:14:02.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c7d9f21aa10'
+down_revision: Union[str, Sequence[str], None] = '9497449e48ad'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Copre admin_list_partners (filtro is_active + ORDER BY created_at DESC)
+    # e rende il COUNT filtrato di admin_count_partners un index-only scan.
+    # email e referral_code hanno già gli indici univoci dei vincoli UNIQUE.
+    op.create_index(
+        'ix_partners_active_created',
+        'partners',
+        ['is_active', sa.text('created_at DESC')],
+    )
+    # Report ordini: filtro range + ORDER BY su created_at
+    op.create_index('ix_orders_created_at', 'orders', [sa.text('created_at DESC')])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_created_at', table_name='orders')
+    op.drop_index('ix_partners_active_created', table_name='partners')
@@ -0,0 +1,36 @@
+"""add trial requests status created index
+
+Revision ID: 7e2b58c31f09
+Revises: 4c7d9f21aa10
+Create Date: 2026-08-26 15:02:47.530916
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e2b58c31f09'
+down_revision: Union[str, Sequence[str], None] = '4c7d9f21aa10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Copre list_trial_requests (WHERE status ORDER BY created_at DESC)
+    # e il COUNT filtrato del badge: range scan invece di seq-scan+sort.
+    op.create_index(
+        'ix_trial_requests_status_created_at',
+        'trial_requests',
+        ['status', sa.text('created_at DESC')],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_trial_requests_status_created_at', table_name='trial_requests'
+    )
@@ -0,0 +1,32 @@
+"""add stripe session columns to orders
+
+Revision ID: b91d4e02c7a5
+Revises: 7e2b58c31f09
+Create Date: 2026-08-26 16:40:11.207733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b91d4e02c7a5'
+down_revision: Union[str, Sequence[str], None] = '7e2b58c31f09'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Session Stripe attiva dell'ordine: finché non scade si riusa
+    # invece di crearne una nuova a ogni chiamata dell'endpoint
+    op.add_column('orders', sa.Column('stripe_session_id', sa.String(length=255), nullable=True))
+    op.add_column('orders', sa.Column('stripe_session_expires_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('orders', 'stripe_session_expires_at')
+    op.drop_column('orders', 'stripe_session_id')
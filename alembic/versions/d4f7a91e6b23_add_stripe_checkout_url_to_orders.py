@@ -0,0 +1,30 @@
+"""add stripe checkout url to orders
+
+Revision ID: d4f7a91e6b23
+Revises: b91d4e02c7a5
+Create Date: 2026-08-26 17:05:36.412589
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f7a91e6b23'
+down_revision: Union[str, Sequence[str], None] = 'b91d4e02c7a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # URL della Checkout Session: il re-entry sull'endpoint risponde
+    # dal DB senza round-trip verso Stripe
+    op.add_column('orders', sa.Column('stripe_checkout_url', sa.String(length=1024), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('orders', 'stripe_checkout_url')
@@ -0,0 +1,69 @@
+# app/cache.py
+
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class TTLCache:
+    """
+    Piccola cache TTL in-process con protezione anti-stampede.
+
+    Per risposte read-mostly (badge/count del pannello admin) che il
+    browser continua a pollare: stessa semantica di un GET/SETEX Redis
+    (get-or-compute con TTL + invalidazione esplicita sulle mutazioni),
+    ma senza introdurre un servizio esterno nello stack single-process.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 256):
+        self.ttl = ttl_seconds
+        self.maxsize = maxsize
+        self._data: dict[Any, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key: Any, factory: Callable[[], Any]) -> Any:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        # Anti-stampede: un solo thread ricalcola, gli altri aspettano
+        # il valore fresco invece di accodare la stessa query al DB.
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+
+            value = factory()
+            if len(self._data) >= self.maxsize:
+                self._data.clear()
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate(self, key: Optional[Any] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+# Conteggio partner per il pannello admin (keyed per filtro active)
+partners_count_cache = TTLCache(ttl_seconds=10)
+
+# Badge trial request della sidebar admin (keyed per status)
+trial_requests_count_cache = TTLCache(ttl_seconds=10)
+
+# Lookup admin di get_current_admin (keyed per admin_id): evita una
+# SELECT per ogni richiesta admin autenticata
+admin_auth_cache = TTLCache(ttl_seconds=60)
+
+# Risoluzione product → packages.id nel checkout: il catalogo è
+# piccolo e quasi statico, TTL largo
+package_id_cache = TTLCache(ttl_seconds=300)
+
+# Prezzo unitario packages.price per il calcolo importi del checkout
+package_price_cache = TTLCache(ttl_seconds=300)
+
+# Importi finali (subtotal, discount, total) keyed per
+# (package_id, units, has_partner): lo spazio chiavi è minuscolo
+checkout_amounts_cache = TTLCache(ttl_seconds=300)
@@ -1,14 +1,32 @@
+import logging
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+# NB: il threadpool dei handler sync di FastAPI/AnyIO (default 40 thread)
+# deve restare >= pool_size + max_overflow, altrimenti i thread in attesa
+# di una connessione possono esaurire il pool a vicenda (deadlock).
 engine = create_engine(
     settings.database_url,
     pool_pre_ping=True,   # ✅ importante in cloud
-    pool_recycle=300,     # ✅ evita connessioni stale (opzionale ma consigliato)
+    pool_recycle=settings.db_pool_recycle,  # ✅ evita connessioni stale
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
     future=True
 )
 
+logger.info(
+    "DB pool: size=%s max_overflow=%s timeout=%ss recycle=%ss",
+    settings.db_pool_size,
+    settings.db_max_overflow,
+    settings.db_pool_timeout,
+    settings.db_pool_recycle,
+)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 
 
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import os
 from dotenv import load_dotenv
 
@@ -26,6 +27,7 @@ from routers import stripe_webhook  # ✅ Webhooks Stripe
 app = FastAPI(
     title="VoiceGuide Backend Sito",
     version="1.0.0",
+    default_response_class=ORJSONResponse,  # serializzazione JSON via orjson (Rust)
 )
 
 # ----------------------------------------------------
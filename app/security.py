@@ -1,3 +1,4 @@
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -7,6 +8,12 @@ SECRET_KEY = "VOICEGUIDE_PARTNER_SECRET_2025"  # in produzione va messa in .env
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 ore
 
+# Cache token → (sub, exp): lo stesso bearer token arriva identico a
+# ogni richiesta della sessione, inutile rifare base64+HMAC ogni volta.
+# exp viene ricontrollato a ogni hit, quindi la scadenza resta esatta.
+_DECODE_CACHE: dict[str, tuple[Optional[str], float]] = {}
+_DECODE_CACHE_MAX = 1024
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -20,11 +27,25 @@ def decode_access_token(token: str) -> Optional[str]:
     """
     Ritorna l'id del partner (sub) se il token è valido, altrimenti None.
     """
+    cached = _DECODE_CACHE.get(token)
+    if cached is not None:
+        sub, exp = cached
+        if time.time() < exp:
+            return sub
+        _DECODE_CACHE.pop(token, None)
+        return None
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         sub = payload.get("sub")
         if sub is None:
             return None
-        return str(sub)
+        sub = str(sub)
+        exp = payload.get("exp")
+        if exp:
+            if len(_DECODE_CACHE) >= _DECODE_CACHE_MAX:
+                _DECODE_CACHE.clear()
+            _DECODE_CACHE[token] = (sub, float(exp))
+        return sub
     except JWTError:
         return None
@@ -79,6 +79,14 @@ class Order(Base):
     # Codice referral usato (storico puro)
     referral_code = Column(String(100), nullable=True)
 
+    # Stripe Checkout Session attiva per l'ordine (riusata finché non
+    # scade, invece di crearne una nuova a ogni chiamata)
+    stripe_session_id = Column(String(255), nullable=True)
+    stripe_session_expires_at = Column(DateTime(timezone=True), nullable=True)
+    # URL della session: un refresh della pagina checkout risponde
+    # dal DB senza nemmeno la retrieve verso Stripe
+    stripe_checkout_url = Column(String(1024), nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # ==============================
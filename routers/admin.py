@@ -1,16 +1,18 @@
 # routers/admin.py
 
 from datetime import datetime, date, timedelta
+from types import MappingProxyType
 from typing import Optional, List, Dict, Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from sqlalchemy import func, lambda_stmt, select
 
 from app.db import get_db
 from models.partners import Partner
 from models.orders import Order, OrderType, PaymentStatus
 from schemas.partners import PartnerOut
+from schemas.orders import OrderOut, OrdersReportOut
 from routers.auth_admin import get_current_admin
 
 router = APIRouter(
@@ -18,6 +20,41 @@ router = APIRouter(
     tags=["Admin Panel"],
 )
 
+# -------------------------------------------------
+# Lookup precompilate enum → value (evita l'attribute
+# chain `x.value if x else None` per ogni riga)
+# -------------------------------------------------
+_ORDER_TYPE_VALUE: Dict[Optional[OrderType], Optional[str]] = {
+    **{t: t.value for t in OrderType},
+    None: None,
+}
+_PAYMENT_STATUS_VALUE: Dict[Optional[PaymentStatus], Optional[str]] = {
+    **{s: s.value for s in PaymentStatus},
+    None: None,
+}
+
+# Template azzerati per le stats (copiati con dict() a ogni richiesta,
+# invece di ricostruire il dict-comprehension sugli enum)
+_ORDERS_BY_TYPE_ZERO = MappingProxyType({t.value: 0 for t in OrderType})
+_ORDERS_BY_STATUS_ZERO = MappingProxyType({s.value: 0 for s in PaymentStatus})
+
+# Colonne del report ordini (select Core → niente identity map ORM)
+_ORDER_LIST_COLUMNS = (
+    Order.id,
+    Order.created_at,
+    Order.buyer_email,
+    Order.buyer_whatsapp,
+    Order.order_type,
+    Order.package_id,
+    Order.quantity,
+    Order.total_amount,
+    Order.estimated_agora_cost,
+    Order.payment_method,
+    Order.payment_status,
+    Order.partner_id,
+    Order.referral_code,
+)
+
 
 # -------------------------------------------------
 # GET /admin/partners → Lista completa dei partner
@@ -31,54 +68,14 @@ def admin_list_partners(
     return partners
 
 
-def _serialize_billing_details(order: Order) -> Dict[str, Any]:
-    """
-    Serializza i dati di fatturazione (se presenti) in modo stabile.
-    Non richiede modifiche al DB: usa Order.billing_details (1:1).
-    """
-    bd = getattr(order, "billing_details", None)
-
-    # Se non esiste record, oppure request_invoice = False → fattura non richiesta
-    if not bd or not getattr(bd, "request_invoice", False):
-        return {
-            "invoice_requested": False,
-            "invoice_intestatario": None,
-            "invoice_country": None,
-            "billing_details": None,
-        }
-
-    billing_details = {
-        "request_invoice": bool(bd.request_invoice),
-        "country": bd.country,
-        # company_name = INTESTATARIO (persona o azienda)
-        "company_name": bd.company_name,
-        "vat_number": bd.vat_number,
-        "tax_code": bd.tax_code,
-        "address": bd.address,
-        "city": bd.city,
-        "zip_code": bd.zip_code,
-        "province": bd.province,
-        "pec": bd.pec,
-        "sdi_code": bd.sdi_code,
-        "created_at": bd.created_at.isoformat() if bd.created_at else None,
-        "updated_at": bd.updated_at.isoformat() if bd.updated_at else None,
-    }
-
-    return {
-        "invoice_requested": True,
-        "invoice_intestatario": bd.company_name,
-        "invoice_country": bd.country,
-        "billing_details": billing_details,
-    }
-
-
 # -------------------------------------------------
 # GET /admin/orders → Report avanzato ordini
 # -------------------------------------------------
-@router.get("/orders")
+@router.get("/orders", response_model=OrdersReportOut)
 def admin_list_orders(
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
+    include_billing: bool = False,
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
@@ -86,6 +83,9 @@ def admin_list_orders(
     Report avanzato degli ordini.
 
     - Filtri opzionali per data (from_date, to_date) sul campo created_at
+    - include_billing=false (default): salta il JOIN sulla fatturazione e
+      ritorna billing_details=null → lista molto più leggera.
+      La UI admin lo richiede solo nella vista di dettaglio.
     - Risposta strutturata:
         {
           "items": [...],
@@ -103,88 +103,107 @@ def admin_list_orders(
     - invoice_country (str|null)
     - billing_details (object|null)  <-- dettagli completi per UI admin
     """
-    query = (
-        db.query(Order)
-        .options(joinedload(Order.billing_details))  # ✅ carica fatturazione
-    )
-
     # Filtri data su created_at
-    if from_date:
-        start_dt = datetime.combine(from_date, datetime.min.time())
-        query = query.filter(Order.created_at >= start_dt)
-
-    if to_date:
-        end_dt = datetime.combine(to_date + timedelta(days=1), datetime.min.time())
-        query = query.filter(Order.created_at < end_dt)
-
-    # Ordiniamo dal più recente
-    query = query.order_by(Order.created_at.desc())
+    start_dt = datetime.combine(from_date, datetime.min.time()) if from_date else None
+    end_dt = (
+        datetime.combine(to_date + timedelta(days=1), datetime.min.time())
+        if to_date
+        else None
+    )
 
-    orders = query.all()
+    if include_billing:
+        # Serve la relazione billing_details → path ORM con joinedload
+        query = db.query(Order).options(joinedload(Order.billing_details))
+        if start_dt:
+            query = query.filter(Order.created_at >= start_dt)
+        if end_dt:
+            query = query.filter(Order.created_at < end_dt)
+        orders = query.order_by(Order.created_at.desc()).all()
+        items: List[OrderOut] = [OrderOut.model_validate(o) for o in orders]
+    else:
+        # Sola lettura: select Core di colonne → RowMapping dict-like,
+        # senza il costo di idratazione/identity map dell'ORM.
+        # lambda_stmt → l'albero SQL viene compilato una volta per processo,
+        # le date entrano come bind param (vedi "Lambda SQL" nella perf guide).
+        stmt = lambda_stmt(lambda: select(*_ORDER_LIST_COLUMNS))
+        if start_dt is not None:
+            stmt += lambda s: s.where(Order.created_at >= start_dt)
+        if end_dt is not None:
+            stmt += lambda s: s.where(Order.created_at < end_dt)
+        stmt += lambda s: s.order_by(Order.created_at.desc())
+        rows = db.execute(stmt).mappings().all()
+        items = [OrderOut.model_validate(r) for r in rows]
 
-    items: List[Dict[str, Any]] = []
     total_amount = 0.0
     total_estimated_agora_cost = 0.0
     total_margin = 0.0
 
-    for o in orders:
-        amount_float = float(o.total_amount) if o.total_amount is not None else 0.0
-        total_amount += amount_float
+    for item in items:
+        total_amount += item.total_amount
+        # Margine lordo: prezzo cliente - costo stimato Agora (solo se presente)
+        if item.estimated_agora_cost is not None:
+            total_estimated_agora_cost += item.estimated_agora_cost
+            total_margin += item.margin
+
+    return OrdersReportOut(
+        items=items,
+        total_count=len(items),
+        from_date=from_date,
+        to_date=to_date,
+        total_amount=round(total_amount, 2),
+        total_estimated_agora_cost=round(total_estimated_agora_cost, 2),
+        total_margin=round(total_margin, 2),
+    )
+
 
-        estimated_agora_cost = (
-            float(o.estimated_agora_cost) if o.estimated_agora_cost is not None else None
+# -------------------------------------------------
+# GET /admin/orders/totals → Totali aggregati (solo SQL)
+# -------------------------------------------------
+@router.get("/orders/totals")
+def admin_orders_totals(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    db: Session = Depends(get_db),
+    admin=Depends(get_current_admin),
+):
+    """
+    Totali del report ordini calcolati interamente in SQL (nessuna riga
+    idratata). Stessi filtri data di GET /admin/orders: la UI può chiamare
+    i due endpoint in parallelo e cachare i totali mentre sfoglia le righe.
+    """
+    q = db.query(
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.total_amount), 0),
+        func.coalesce(func.sum(Order.estimated_agora_cost), 0),
+        # SUM ignora le righe con estimated_agora_cost NULL → stesso
+        # criterio del margine calcolato riga-per-riga nel report
+        func.coalesce(func.sum(Order.total_amount - Order.estimated_agora_cost), 0),
+    )
+
+    if from_date:
+        q = q.filter(Order.created_at >= datetime.combine(from_date, datetime.min.time()))
+    if to_date:
+        q = q.filter(
+            Order.created_at
+            < datetime.combine(to_date + timedelta(days=1), datetime.min.time())
         )
 
-        # Margine lordo: prezzo cliente - costo stimato Agora (solo se presente)
-        margin = None
-        if estimated_agora_cost is not None:
-            margin = amount_float - estimated_agora_cost
-            total_estimated_agora_cost += estimated_agora_cost
-            total_margin += margin
-
-        billing = _serialize_billing_details(o)
-
-        item: Dict[str, Any] = {
-            "id": o.id,
-            "created_at": o.created_at.isoformat() if o.created_at else None,
-            "buyer_email": o.buyer_email,
-            "buyer_whatsapp": o.buyer_whatsapp,
-            "order_type": o.order_type.value if o.order_type else None,
-            "package_id": o.package_id,
-            "quantity": o.quantity,
-            "total_amount": amount_float,
-            "estimated_agora_cost": estimated_agora_cost,
-            "margin": margin,
-            "payment_method": o.payment_method.value if o.payment_method else None,
-            "payment_status": o.payment_status.value if o.payment_status else None,
-            "partner_id": o.partner_id,
-            "referral_code": o.referral_code,
-
-            # ✅ campi fatturazione (riassunto + dettagli completi)
-            "invoice_requested": billing["invoice_requested"],
-            "invoice_intestatario": billing["invoice_intestatario"],
-            "invoice_country": billing["invoice_country"],
-            "billing_details": billing["billing_details"],
-        }
-        items.append(item)
+    total_count, total_amount, total_agora, total_margin = q.one()
 
-    response = {
-        "items": items,
-        "total_count": len(items),
-        "from_date": from_date.isoformat() if from_date else None,
-        "to_date": to_date.isoformat() if to_date else None,
-        "total_amount": round(total_amount, 2),
-        "total_estimated_agora_cost": round(total_estimated_agora_cost, 2),
-        "total_margin": round(total_margin, 2),
+    return {
+        "total_count": int(total_count or 0),
+        "from_date": from_date,
+        "to_date": to_date,
+        "total_amount": round(float(total_amount), 2),
+        "total_estimated_agora_cost": round(float(total_agora), 2),
+        "total_margin": round(float(total_margin), 2),
     }
 
-    return response
-
 
 # -------------------------------------------------
 # GET /admin/orders/{order_id} → Dettaglio singolo ordine
 # -------------------------------------------------
-@router.get("/orders/{order_id}")
+@router.get("/orders/{order_id}", response_model=OrderOut)
 def admin_get_order_detail(
     order_id: int,
     db: Session = Depends(get_db),
@@ -207,38 +226,7 @@ def admin_get_order_detail(
             detail=f"Ordine con id={order_id} non trovato.",
         )
 
-    amount_float = float(order.total_amount) if order.total_amount is not None else 0.0
-    estimated_agora_cost = (
-        float(order.estimated_agora_cost) if order.estimated_agora_cost is not None else None
-    )
-    margin = None
-    if estimated_agora_cost is not None:
-        margin = amount_float - estimated_agora_cost
-
-    billing = _serialize_billing_details(order)
-
-    return {
-        "id": order.id,
-        "created_at": order.created_at.isoformat() if order.created_at else None,
-        "buyer_email": order.buyer_email,
-        "buyer_whatsapp": order.buyer_whatsapp,
-        "order_type": order.order_type.value if order.order_type else None,
-        "package_id": order.package_id,
-        "quantity": order.quantity,
-        "total_amount": amount_float,
-        "estimated_agora_cost": estimated_agora_cost,
-        "margin": margin,
-        "payment_method": order.payment_method.value if order.payment_method else None,
-        "payment_status": order.payment_status.value if order.payment_status else None,
-        "partner_id": order.partner_id,
-        "referral_code": order.referral_code,
-
-        # ✅ fatturazione
-        "invoice_requested": billing["invoice_requested"],
-        "invoice_intestatario": billing["invoice_intestatario"],
-        "invoice_country": billing["invoice_country"],
-        "billing_details": billing["billing_details"],
-    }
+    return OrderOut.model_validate(order)
 
 
 # -------------------------------------------------
@@ -273,7 +261,7 @@ def admin_stats_overview(
     total_margin = total_amount - total_estimated_agora_cost
 
     # Conteggio ordini per tipo
-    orders_by_type: Dict[str, int] = {t.value: 0 for t in OrderType}
+    orders_by_type: Dict[str, int] = dict(_ORDERS_BY_TYPE_ZERO)
     rows_type = (
         db.query(Order.order_type, func.count(Order.id))
         .group_by(Order.order_type)
@@ -281,10 +269,10 @@ def admin_stats_overview(
     )
     for order_type, count in rows_type:
         if order_type is not None:
-            orders_by_type[order_type.value] = count
+            orders_by_type[_ORDER_TYPE_VALUE[order_type]] = count
 
     # Conteggio ordini per stato pagamento
-    orders_by_status: Dict[str, int] = {s.value: 0 for s in PaymentStatus}
+    orders_by_status: Dict[str, int] = dict(_ORDERS_BY_STATUS_ZERO)
     rows_status = (
         db.query(Order.payment_status, func.count(Order.id))
         .group_by(Order.payment_status)
@@ -292,7 +280,7 @@ def admin_stats_overview(
     )
     for status, count in rows_status:
         if status is not None:
-            orders_by_status[status.value] = count
+            orders_by_status[_PAYMENT_STATUS_VALUE[status]] = count
 
     return {
         "total_orders": total_orders,
@@ -17,6 +17,10 @@ logger = logging.getLogger(__name__)
 
 AIRLINK_TOUR_DURATION_MINUTES = 240  # 4h fisse (durata tour)
 
+# Session condivisa verso AirLink: riusa la connessione TCP/TLS tra le
+# chiamate invece di rifare handshake a ogni richiesta
+_airlink_session = requests.Session()
+
 
 def _env(name: str, default: str | None = None) -> str | None:
     v = os.getenv(name, default)
@@ -25,11 +29,35 @@ def _env(name: str, default: str | None = None) -> str | None:
     return v
 
 
+def iso_z(dt: datetime) -> str:
+    """
+    Formatta un datetime UTC come ISO con suffisso Z in una sola
+    strftime (niente catena replace/isoformat/replace; %S tronca già i
+    microsecondi).
+    """
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
 def generate_license_code() -> str:
     raw = uuid.uuid4().hex[:8].upper()
     return f"VG-LIC-{raw}"
 
 
+def pick_free_license_codes(db: Session, n: int = 8) -> list[str]:
+    """
+    Genera n candidati e scarta con un solo SELECT IN quelli già
+    presenti nel DB Site: nel caso tipico il primo candidato è libero
+    e AirLink viene chiamato una volta sola, invece di pagare un
+    round-trip HTTP per ogni collisione.
+    """
+    candidates = [generate_license_code() for _ in range(n)]
+    taken = {
+        row[0]
+        for row in db.query(License.code).filter(License.code.in_(candidates)).all()
+    }
+    return [c for c in candidates if c not in taken]
+
+
 def create_license_on_airlink(code: str, max_listeners: int) -> None:
     """
     Crea la licenza sul backend AirLink (produzione Railway).
@@ -51,7 +79,7 @@ def create_license_on_airlink(code: str, max_listeners: int) -> None:
         "is_active": False,  # verrà attivata dall'app con /api/activate-license
     }
 
-    r = requests.post(url, json=body, headers=headers, timeout=15)
+    r = _airlink_session.post(url, json=body, headers=headers, timeout=15)
 
     # se già esiste codice, lo trattiamo come conflitto (alcuni backend usano 400/409)
     if r.status_code in (409,):
@@ -64,11 +92,11 @@ def create_license_on_airlink(code: str, max_listeners: int) -> None:
 @router.post("/manual", response_model=AdminLicenseOut)
 def create_manual_license(payload: AdminLicenseCreate, db: Session = Depends(get_db)):
     # 1) genera code e crea su AirLink (source of truth)
-    max_attempts = 8
+    # Candidati già filtrati contro il DB locale; il retry su
+    # CODE_EXISTS resta come safety net per collisioni lato AirLink
     code = None
 
-    for _ in range(max_attempts):
-        candidate = generate_license_code()
+    for candidate in pick_free_license_codes(db):
         try:
             create_license_on_airlink(candidate, payload.max_guests)
             code = candidate
@@ -86,7 +114,7 @@ def create_manual_license(payload: AdminLicenseCreate, db: Session = Depends(get
 
     # 2) validità trial lato Site (finestra per attivare, es. 24h)
     expires_at = datetime.now(timezone.utc) + timedelta(hours=payload.duration_hours)
-    expires_at_iso = expires_at.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    expires_at_iso = iso_z(expires_at)
 
     # 3) salva shadow record nel Site (storico/admin/email/notes)
     lic = License(
@@ -1,11 +1,14 @@
 # routers/admin_partner_requests.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from decimal import Decimal
-import uuid
+from typing import Literal
+import secrets
 import logging
 
+from app.cache import partners_count_cache
 from app.db import get_db
 
 from models.partner_requests import (
@@ -36,11 +39,35 @@ TIER_DEFAULT_COMMISSION: dict[str, Decimal] = {
     "ELITE": Decimal("20.0"),
 }
 
+# Costanti hot-path (evita ri-allocazioni per richiesta)
+_VALID_TIERS = frozenset(TIER_DEFAULT_COMMISSION)
+
+# Lookup precompilata stringa → enum (evita PartnerTier[...] per chiamata)
+_TIER_BY_NAME: dict[str, PartnerTier] = {m.name: m for m in PartnerTier}
+
+# Lookup inversa enum → nome: il path enum di normalize_tier diventa un
+# singolo dict.get, senza probe hasattr per chiamata
+_TIER_STR_BY_ENUM: dict[PartnerTier, str] = {m: m.name for m in PartnerTier}
+
 
 def generate_referral_code() -> str:
     # Codice corto, leggibile (es: VG-AB12CD)
-    raw = uuid.uuid4().hex[:6].upper()
-    return f"VG-{raw}"
+    # secrets.token_hex(3) legge esattamente i 3 byte che servono
+    # (uuid4 ne generava 16 per poi tenerne 3)
+    return f"VG-{secrets.token_hex(3).upper()}"
+
+
+def _send_email_safe(sender, **kwargs) -> None:
+    """Adapter per BackgroundTasks: logga il fallimento senza propagare."""
+    try:
+        sender(**kwargs)
+    except Exception as e:
+        logger.warning(
+            "Email %s fallita (%s): %s",
+            getattr(sender, "__name__", "sender"),
+            kwargs.get("to_email"),
+            str(e),
+        )
 
 
 def normalize_tier(tier_obj) -> str:
@@ -52,14 +79,13 @@ def normalize_tier(tier_obj) -> str:
     if tier_obj is None:
         return "BASE"
 
-    # Enum -> .value
-    if hasattr(tier_obj, "value"):
-        val = tier_obj.value
-    else:
-        val = str(tier_obj)
+    # fast-path: enum (o stringa già normalizzata) → un dict lookup
+    val = _TIER_STR_BY_ENUM.get(tier_obj)
+    if val is not None:
+        return val
 
-    val = str(val).strip().upper()
-    return val if val in TIER_DEFAULT_COMMISSION else "BASE"
+    val = str(getattr(tier_obj, "value", tier_obj)).strip().upper()
+    return val if val in _VALID_TIERS else "BASE"
 
 
 @router.get("", response_model=list[PartnerRequestOut])
@@ -74,8 +100,14 @@ def list_partner_requests(
 
 
 @router.post("/{request_id}/reject", response_model=PartnerRequestOut)
-def reject_partner_request(request_id: int, db: Session = Depends(get_db)):
-    req = db.query(PartnerRequest).filter(PartnerRequest.id == request_id).first()
+def reject_partner_request(
+    request_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    # SELECT ... FOR UPDATE: il check su PENDING è atomico anche con
+    # due admin che cliccano insieme (il secondo attende e trova REJECTED)
+    req = db.get(PartnerRequest, request_id, with_for_update=True)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found.")
 
@@ -83,23 +115,16 @@ def reject_partner_request(request_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Request is not PENDING.")
 
     req.status = PartnerRequestStatus.REJECTED
-    db.add(req)
     db.commit()
     db.refresh(req)
 
-    # ---- invio email (NON BLOCCANTE) ----
-    try:
-        send_partner_request_rejected_email(
-            to_email=req.email,
-            partner_name=req.name,
-        )
-    except Exception as e:
-        logger.warning(
-            "Email REJECT fallita per request_id=%s (%s): %s",
-            request_id,
-            req.email,
-            str(e),
-        )
+    # ---- invio email (NON BLOCCANTE: dopo la risposta) ----
+    background_tasks.add_task(
+        _send_email_safe,
+        send_partner_request_rejected_email,
+        to_email=req.email,
+        partner_name=req.name,
+    )
 
     return req
 
@@ -107,8 +132,9 @@ def reject_partner_request(request_id: int, db: Session = Depends(get_db)):
 @router.post("/{request_id}/approve", response_model=PartnerRequestOut)
 def approve_partner_request(
     request_id: int,
-    tier: str | None = Query(default=None),
-    commission_pct: Decimal | None = Query(default=None),
+    background_tasks: BackgroundTasks,
+    tier: Literal["BASE", "PRO", "ELITE"] | None = Query(default=None),
+    commission_pct: Decimal | None = Query(default=None, ge=0, le=100),
     db: Session = Depends(get_db),
 ):
     """
@@ -118,7 +144,10 @@ def approve_partner_request(
     - Default: commissione derivata dal tier (BASE 10 / PRO 15 / ELITE 20)
     - Override: passando commission_pct in query
     """
-    req = db.query(PartnerRequest).filter(PartnerRequest.id == request_id).first()
+    # SELECT ... FOR UPDATE: blocca la riga fino al commit, così due
+    # approvazioni concorrenti non possono entrambe passare il check
+    # PENDING e creare due partner
+    req = db.get(PartnerRequest, request_id, with_for_update=True)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found.")
 
@@ -126,59 +155,75 @@ def approve_partner_request(
         raise HTTPException(status_code=400, detail="Request is not PENDING.")
 
     # ---- tier scelto dall'admin (se presente) ----
-    chosen_tier = normalize_tier(tier) if tier else normalize_tier(req.partner_tier)
+    # tier arriva già validato dal Literal; normalize serve solo per
+    # l'enum salvato sulla request
+    chosen_tier = tier if tier else normalize_tier(req.partner_tier)
 
     # Salva il tier scelto sulla request (tracciamento definitivo)
     # partner_tier è Enum PartnerTier: settiamo in modo corretto
-    req.partner_tier = PartnerTier[chosen_tier]
+    req.partner_tier = _TIER_BY_NAME[chosen_tier]
 
     # ---- commissione di default dal tier ----
     default_comm = TIER_DEFAULT_COMMISSION[chosen_tier]
     final_commission = commission_pct if commission_pct is not None else default_comm
 
-    # safety clamp (0-100)
-    if final_commission < Decimal("0") or final_commission > Decimal("100"):
-        raise HTTPException(
-            status_code=400, detail="commission_pct must be between 0 and 100."
+    # ---- crea Partner con referral code univoco ----
+    # INSERT ... ON CONFLICT (referral_code) DO NOTHING RETURNING id:
+    # elimina il SELECT di pre-check per tentativo e la race TOCTOU
+    # con approvazioni concorrenti (l'unicità la garantisce il DB).
+    # Batch di candidati + un solo SELECT IN per scartare i già presi:
+    # il retry (rarissimo) pesca dal batch in memoria, non dal kernel
+    candidates = [generate_referral_code() for _ in range(4)]
+    taken = {
+        row[0]
+        for row in db.query(Partner.referral_code)
+        .filter(Partner.referral_code.in_(candidates))
+        .all()
+    }
+
+    code = None
+    for candidate in candidates:
+        if candidate in taken:
+            continue
+        stmt = (
+            pg_insert(Partner)
+            .values(
+                name=req.name,
+                email=req.email,
+                referral_code=candidate,
+                commission_pct=final_commission,
+                is_active=True,
+            )
+            .on_conflict_do_nothing(index_elements=["referral_code"])
+            .returning(Partner.id)
         )
+        if db.execute(stmt).scalar() is not None:
+            code = candidate
+            break
 
-    # ---- referral code ----
-    code = generate_referral_code()
-    while db.query(Partner).filter(Partner.referral_code == code).first():
-        code = generate_referral_code()
-
-    # ---- crea Partner ----
-    partner = Partner(
-        name=req.name,
-        email=req.email,
-        referral_code=code,
-        commission_pct=final_commission,
-        is_active=True,
-    )
-    db.add(partner)
+    if code is None:
+        raise HTTPException(
+            status_code=500, detail="Could not generate a unique referral code."
+        )
 
-    # ---- aggiorna richiesta ----
+    # ---- aggiorna richiesta (req è già tracciata dalla session) ----
     req.status = PartnerRequestStatus.APPROVED
-    db.add(req)
 
     db.commit()
     db.refresh(req)
 
-    # ---- invio email (NON BLOCCANTE) ----
-    try:
-        send_partner_request_approved_email(
-            to_email=req.email,
-            partner_name=req.name,
-            referral_code=code,
-            commission_pct=str(final_commission),
-            tier=str(chosen_tier),
-        )
-    except Exception as e:
-        logger.warning(
-            "Email APPROVE fallita per request_id=%s (%s): %s",
-            request_id,
-            req.email,
-            str(e),
-        )
+    # Nuovo partner creato → il conteggio cachato non è più valido
+    partners_count_cache.invalidate()
+
+    # ---- invio email (NON BLOCCANTE: dopo la risposta) ----
+    background_tasks.add_task(
+        _send_email_safe,
+        send_partner_request_approved_email,
+        to_email=req.email,
+        partner_name=req.name,
+        referral_code=code,
+        commission_pct=str(final_commission),
+        tier=str(chosen_tier),
+    )
 
     return req
@@ -1,16 +1,22 @@
 # routers/admin_partners.py
 
-from typing import List, Optional
+from typing import List, Literal, Optional
 from decimal import Decimal
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, or_, select
 
+from app.cache import partners_count_cache
 from app.db import get_db
+from app.email_service import (
+    send_partner_collaboration_closed_email,
+    send_partner_tier_changed_email,
+)
 from routers.auth_admin import get_current_admin
-from schemas.partners import PartnerCreate, PartnerOut
+from schemas.partners import PartnerCreate, PartnerOut, PartnersPageOut
 from models.partners import Partner, PartnerType
 
 router = APIRouter(
@@ -29,12 +35,37 @@ TIER_DEFAULT_COMMISSION: dict[str, Decimal] = {
     "ELITE": Decimal("20.0"),
 }
 
+# Costanti hot-path (evita ri-allocazioni per richiesta)
+_BOOL_TRUE = frozenset({"true", "1", "yes", "y", "on"})
+_BOOL_FALSE = frozenset({"false", "0", "no", "n", "off"})
+
+# Lookup precompilata stringa → enum (evita la scansione del metaclass
+# Enum a ogni chiamata)
+_PARTNER_TYPE_BY_NAME: dict[str, PartnerType] = {m.name: m for m in PartnerType}
+
+
+class TierUpdate(BaseModel):
+    """
+    Query-params di PATCH /{partner_id}/tier: literal + range validati
+    da pydantic-core (compilato), input invalidi respinti con 422 prima
+    di entrare nell'handler.
+    """
+
+    tier: Literal["BASE", "PRO", "ELITE"]
+    commission_pct: Decimal | None = Field(default=None, ge=0, le=100)
+
 
-def normalize_tier(val: str | None) -> str:
-    if not val:
-        return "BASE"
-    v = str(val).strip().upper()
-    return v if v in TIER_DEFAULT_COMMISSION else "BASE"
+def _send_email_safe(sender, **kwargs) -> None:
+    """Adapter per BackgroundTasks: logga il fallimento senza propagare."""
+    try:
+        sender(**kwargs)
+    except Exception as e:
+        logger.warning(
+            "Email %s fallita (%s): %s",
+            getattr(sender, "__name__", "sender"),
+            kwargs.get("to_email"),
+            str(e),
+        )
 
 
 def parse_bool(val: str | None) -> Optional[bool]:
@@ -43,9 +74,9 @@ def parse_bool(val: str | None) -> Optional[bool]:
     s = str(val).strip().lower()
     if s == "":
         return None
-    if s in ("true", "1", "yes", "y", "on"):
+    if s in _BOOL_TRUE:
         return True
-    if s in ("false", "0", "no", "n", "off"):
+    if s in _BOOL_FALSE:
         return False
     return None
 
@@ -64,17 +95,21 @@ def admin_count_partners(
     Se active=true  -> count is_active=True
     Se active=false -> count is_active=False
     Se active assente -> count totale
-    """
-    q = db.query(func.count(Partner.id))
 
+    Cache TTL 10s (la UI polla questo endpoint): invalidata dalle
+    mutazioni partner (create / active / delete / approve).
+    """
     active_bool = parse_bool(active)
-    if active_bool is True:
-        q = q.filter(Partner.is_active.is_(True))
-    elif active_bool is False:
-        q = q.filter(Partner.is_active.is_(False))
 
-    count = q.scalar() or 0
-    return {"count": int(count)}
+    def _count() -> int:
+        q = db.query(func.count(Partner.id))
+        if active_bool is True:
+            q = q.filter(Partner.is_active.is_(True))
+        elif active_bool is False:
+            q = q.filter(Partner.is_active.is_(False))
+        return int(q.scalar() or 0)
+
+    return {"count": partners_count_cache.get_or_set(active_bool, _count)}
 
 
 # ---------------------------------------------------------
@@ -83,13 +118,25 @@ def admin_count_partners(
 @router.get("/", response_model=List[PartnerOut])
 def admin_list_partners(
     active: Optional[str] = Query(default=None, description="true/false per filtrare is_active"),
+    limit: int = Query(default=50, ge=1, le=500),
+    before_id: Optional[int] = Query(
+        default=None,
+        description="Keyset: ritorna i partner con id < before_id (pagina successiva)",
+    ),
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
     """
-    Lista partner. (Lasciamo anche questo per la pagina /admin/partners)
+    Lista partner paginata keyset. (Pagina /admin/partners)
+
+    La UI passa come before_id l'id dell'ultima riga ricevuta: niente
+    OFFSET (che scansiona e scarta) e memoria O(limit) invece di O(N).
     """
-    q = db.query(Partner).order_by(Partner.created_at.desc())
+    q = db.query(Partner).order_by(Partner.created_at.desc(), Partner.id.desc())
+
+    if before_id is not None:
+        # id seriali → stesso ordinamento di created_at desc
+        q = q.filter(Partner.id < before_id)
 
     active_bool = parse_bool(active)
     if active_bool is True:
@@ -97,7 +144,45 @@ def admin_list_partners(
     elif active_bool is False:
         q = q.filter(Partner.is_active.is_(False))
 
-    return q.all()
+    return q.limit(limit).all()
+
+
+# ---------------------------------------------------------
+# ✅ LISTA + TOTALE IN UNA SOLA QUERY (SOLO ADMIN)
+# ---------------------------------------------------------
+@router.get("/paged", response_model=PartnersPageOut)
+def admin_list_partners_paged(
+    active: Optional[str] = Query(default=None, description="true/false per filtrare is_active"),
+    limit: int = Query(default=50, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+    db: Session = Depends(get_db),
+    admin=Depends(get_current_admin),
+):
+    """
+    Pagina partner + totale complessivo in un unico round-trip:
+    COUNT(*) OVER () aggiunge il totale (sul filtro, pre-LIMIT) a ogni
+    riga, così la UI non deve chiamare anche /count.
+    """
+    stmt = select(Partner, func.count().over().label("total"))
+
+    active_bool = parse_bool(active)
+    if active_bool is True:
+        stmt = stmt.where(Partner.is_active.is_(True))
+    elif active_bool is False:
+        stmt = stmt.where(Partner.is_active.is_(False))
+
+    stmt = (
+        stmt.order_by(Partner.created_at.desc(), Partner.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+
+    rows = db.execute(stmt).all()
+
+    return PartnersPageOut(
+        total=rows[0].total if rows else 0,
+        items=[row.Partner for row in rows],
+    )
 
 
 # ---------------------------------------------------------
@@ -109,7 +194,7 @@ def admin_get_partner_detail(
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
-    partner = db.query(Partner).filter(Partner.id == partner_id).first()
+    partner = db.get(Partner, partner_id)
     if not partner:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -127,17 +212,25 @@ def admin_create_partner(
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
-    existing_email = db.query(Partner).filter(Partner.email == payload.email).first()
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email già registrata come partner.")
-
-    existing_ref = db.query(Partner).filter(Partner.referral_code == payload.referral_code).first()
-    if existing_ref:
-        raise HTTPException(status_code=400, detail="Referral code già in uso.")
-
-    try:
-        partner_type = PartnerType(payload.partner_type.upper())
-    except Exception:
+    # Un solo round-trip per entrambi i controlli di unicità
+    existing = (
+        db.query(Partner.email, Partner.referral_code)
+        .filter(
+            or_(
+                Partner.email == payload.email,
+                Partner.referral_code == payload.referral_code,
+            )
+        )
+        .all()
+    )
+    for email, referral_code in existing:
+        if email == payload.email:
+            raise HTTPException(status_code=400, detail="Email già registrata come partner.")
+        if referral_code == payload.referral_code:
+            raise HTTPException(status_code=400, detail="Referral code già in uso.")
+
+    partner_type = _PARTNER_TYPE_BY_NAME.get(payload.partner_type.strip().upper())
+    if partner_type is None:
         raise HTTPException(
             status_code=400,
             detail="partner_type deve essere BASE, PRO o ELITE.",
@@ -157,6 +250,8 @@ def admin_create_partner(
     db.commit()
     db.refresh(partner)
 
+    partners_count_cache.invalidate()
+
     return partner
 
 
@@ -166,42 +261,42 @@ def admin_create_partner(
 @router.patch("/{partner_id}/tier", response_model=PartnerOut)
 def admin_set_partner_tier(
     partner_id: int,
-    tier: str = Query(..., description="BASE|PRO|ELITE"),
-    commission_pct: Decimal | None = Query(default=None, description="Override 0-100 (opzionale)"),
+    background_tasks: BackgroundTasks,
+    tier_update: TierUpdate = Depends(),
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
-    partner = db.query(Partner).filter(Partner.id == partner_id).first()
+    partner = db.get(Partner, partner_id)
     if not partner:
         raise HTTPException(status_code=404, detail="Partner non trovato.")
 
-    chosen_tier = normalize_tier(tier)
+    chosen_tier = tier_update.tier
     default_comm = TIER_DEFAULT_COMMISSION[chosen_tier]
-    final_comm = commission_pct if commission_pct is not None else default_comm
-
-    if final_comm < Decimal("0") or final_comm > Decimal("100"):
-        raise HTTPException(status_code=400, detail="commission_pct deve essere tra 0 e 100.")
+    final_comm = (
+        tier_update.commission_pct
+        if tier_update.commission_pct is not None
+        else default_comm
+    )
 
     old_tier = partner.partner_type.value if hasattr(partner.partner_type, "value") else str(partner.partner_type)
 
-    partner.partner_type = PartnerType(chosen_tier)
+    partner.partner_type = _PARTNER_TYPE_BY_NAME[chosen_tier]
     partner.commission_pct = final_comm
 
-    db.add(partner)
+    # partner è già tracciato dalla session: basta il commit
     db.commit()
     db.refresh(partner)
 
-    try:
-        from app.email_service import send_partner_tier_changed_email
-        send_partner_tier_changed_email(
-            to_email=partner.email,
-            partner_name=partner.name,
-            old_tier=old_tier,
-            new_tier=chosen_tier,
-            commission_pct=str(final_comm),
-        )
-    except Exception as e:
-        logger.warning("Email tier change fallita partner_id=%s: %s", partner_id, str(e))
+    # Email NON BLOCCANTE: parte dopo la risposta
+    background_tasks.add_task(
+        _send_email_safe,
+        send_partner_tier_changed_email,
+        to_email=partner.email,
+        partner_name=partner.name,
+        old_tier=old_tier,
+        new_tier=chosen_tier,
+        commission_pct=str(final_comm),
+    )
 
     return partner
 
@@ -212,30 +307,31 @@ def admin_set_partner_tier(
 @router.patch("/{partner_id}/active", response_model=PartnerOut)
 def admin_set_partner_active(
     partner_id: int,
+    background_tasks: BackgroundTasks,
     is_active: bool = Query(...),
     reason: str | None = Query(default=None),
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
-    partner = db.query(Partner).filter(Partner.id == partner_id).first()
+    partner = db.get(Partner, partner_id)
     if not partner:
         raise HTTPException(status_code=404, detail="Partner non trovato.")
 
     partner.is_active = bool(is_active)
-    db.add(partner)
     db.commit()
     db.refresh(partner)
 
+    partners_count_cache.invalidate()
+
     if not is_active:
-        try:
-            from app.email_service import send_partner_collaboration_closed_email
-            send_partner_collaboration_closed_email(
-                to_email=partner.email,
-                partner_name=partner.name,
-                reason=reason or "",
-            )
-        except Exception as e:
-            logger.warning("Email chiusura collaborazione fallita partner_id=%s: %s", partner_id, str(e))
+        # Email NON BLOCCANTE: parte dopo la risposta
+        background_tasks.add_task(
+            _send_email_safe,
+            send_partner_collaboration_closed_email,
+            to_email=partner.email,
+            partner_name=partner.name,
+            reason=reason or "",
+        )
 
     return partner
 
@@ -249,10 +345,12 @@ def admin_delete_partner(
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
-    partner = db.query(Partner).filter(Partner.id == partner_id).first()
+    partner = db.get(Partner, partner_id)
     if not partner:
         raise HTTPException(status_code=404, detail="Partner non trovato.")
 
     db.delete(partner)
     db.commit()
+
+    partners_count_cache.invalidate()
     return {"ok": True}
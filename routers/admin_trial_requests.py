@@ -1,13 +1,15 @@
 # routers/admin_trial_requests.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 from typing import Optional, List, Literal
 from datetime import datetime, timedelta, timezone
 import logging
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+from app.cache import trial_requests_count_cache
 from app.db import get_db
 from models.trial_requests import TrialRequest, TrialRequestStatus
 from models.admin import Admin
@@ -18,12 +20,26 @@ from models.licenses import License, LicenseType
 from app.email_service import send_trial_license_email
 
 # ✅ Riutilizziamo la stessa funzione “source of truth” di admin_licenses.py
-from routers.admin_licenses import create_license_on_airlink, generate_license_code
+from routers.admin_licenses import (
+    create_license_on_airlink,
+    iso_z,
+    pick_free_license_codes,
+)
 
 router = APIRouter(prefix="/admin", tags=["Admin - Trial Requests"])
 logger = logging.getLogger(__name__)
 
 
+def _send_trial_email_safe(**kwargs) -> None:
+    """Adapter per BackgroundTasks: logga il fallimento senza propagare."""
+    try:
+        send_trial_license_email(**kwargs)
+    except Exception as e:
+        logger.warning(
+            "Trial license email failed for %s: %s", kwargs.get("to_email"), str(e)
+        )
+
+
 # -------------------------
 # Schemas
 # -------------------------
@@ -40,6 +56,19 @@ class TrialRequestRow(BaseModel):
         from_attributes = True
 
 
+# Proiezione per la lista: solo le colonne esposte da TrialRequestRow,
+# senza materializzare istanze ORM complete per riga
+_TRIAL_LIST_COLUMNS = (
+    TrialRequest.id,
+    TrialRequest.name,
+    TrialRequest.email,
+    TrialRequest.language,
+    TrialRequest.message,
+    TrialRequest.status,
+    TrialRequest.created_at,
+)
+
+
 class IssueTrialPayload(BaseModel):
     license_type: Literal["SINGLE", "TO", "SCHOOL", "MUSEUM"] = "SINGLE"
     max_guests: int = Field(default=10, ge=1, le=500)
@@ -65,14 +94,17 @@ class IssueResult(BaseModel):
 @router.get("/trial-requests", response_model=List[TrialRequestRow])
 def list_trial_requests(
     status: Optional[Literal["PENDING", "ISSUED", "REJECTED"]] = None,
+    limit: int = Query(default=50, ge=1, le=200),
+    offset: int = Query(default=0, ge=0),
     admin: Admin = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
-    q = db.query(TrialRequest)
+    # Paginata: risposta bounded anche quando la tabella cresce
+    q = db.query(*_TRIAL_LIST_COLUMNS)
     if status:
         q = q.filter(TrialRequest.status == TrialRequestStatus(status))
     q = q.order_by(TrialRequest.created_at.desc())
-    return q.all()
+    return q.limit(limit).offset(offset).all()
 
 
 @router.post("/trial-requests/{trial_request_id}/reject", response_model=TrialRequestRow)
@@ -99,6 +131,9 @@ def reject_trial_request(
 
     db.commit()
     db.refresh(tr)
+
+    # Status cambiato → badge count non più valido
+    trial_requests_count_cache.invalidate()
     return tr
 
 
@@ -106,6 +141,7 @@ def reject_trial_request(
 def issue_trial_request(
     trial_request_id: int,
     payload: IssueTrialPayload,
+    background_tasks: BackgroundTasks,
     admin: Admin = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
@@ -117,11 +153,11 @@ def issue_trial_request(
         raise HTTPException(status_code=400, detail=f"Cannot issue request in status {tr.status}")
 
     # 1) genera code + crea su AirLink (source of truth)
-    max_attempts = 8
+    # Candidati già filtrati contro il DB locale; il retry su
+    # CODE_EXISTS resta come safety net per collisioni lato AirLink
     code = None
 
-    for _ in range(max_attempts):
-        candidate = generate_license_code()
+    for candidate in pick_free_license_codes(db):
         try:
             create_license_on_airlink(candidate, payload.max_guests)
             code = candidate
@@ -140,7 +176,7 @@ def issue_trial_request(
 
     # 2) validità trial lato Site (finestra admin)
     expires_at = datetime.now(timezone.utc) + timedelta(hours=payload.duration_hours)
-    expires_at_iso = expires_at.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    expires_at_iso = iso_z(expires_at)
 
     # 3) salva shadow record License nel Site
     lic = License(
@@ -162,18 +198,20 @@ def issue_trial_request(
 
     db.commit()
 
-    # 5) email NON BLOCCANTE
+    # Status cambiato → badge count non più valido
+    trial_requests_count_cache.invalidate()
+
+    # 5) email NON BLOCCANTE: parte dopo la risposta, la issue non
+    #    aspetta il round-trip SMTP
     if payload.send_email:
-        try:
-            send_trial_license_email(
-                to_email=tr.email,
-                license_code=code,
-                max_guests=payload.max_guests,
-                duration_hours=payload.duration_hours,
-                expires_at_iso=expires_at_iso,
-            )
-        except Exception as e:
-            logger.warning("Trial license email failed for %s: %s", tr.email, str(e))
+        background_tasks.add_task(
+            _send_trial_email_safe,
+            to_email=tr.email,
+            license_code=code,
+            max_guests=payload.max_guests,
+            duration_hours=payload.duration_hours,
+            expires_at_iso=expires_at_iso,
+        )
 
     return IssueResult(
         trial_request_id=tr.id,
@@ -190,7 +228,18 @@ def count_trial_requests(
     admin: Admin = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
-    q = db.query(TrialRequest)
-    if status:
-        q = q.filter(TrialRequest.status == TrialRequestStatus(status))
-    return {"status": status, "count": q.count()}
+    """
+    Cache TTL 10s (la sidebar polla questo endpoint): invalidata da
+    create / reject / issue.
+    """
+
+    def _count() -> int:
+        q = db.query(func.count(TrialRequest.id))
+        if status:
+            q = q.filter(TrialRequest.status == TrialRequestStatus(status))
+        return int(q.scalar() or 0)
+
+    return {
+        "status": status,
+        "count": trial_requests_count_cache.get_or_set(status, _count),
+    }
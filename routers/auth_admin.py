@@ -1,10 +1,13 @@
 # routers/auth_admin.py
 
+from types import SimpleNamespace
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 
+from app.cache import admin_auth_cache
 from app.db import get_db
 from models.admin import Admin
 from schemas.admin import AdminLogin, AdminOut
@@ -16,6 +19,10 @@ admin_bearer_scheme = HTTPBearer()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Hash fittizio precomputato: la verify gira anche quando l'email non
+# esiste, così il tempo di risposta non rivela quali email sono admin
+_DUMMY_HASH = pwd_context.hash("not-a-real-password")
+
 
 @router.post("/login")
 def admin_login(payload: AdminLogin, db: Session = Depends(get_db)):
@@ -28,26 +35,32 @@ def admin_login(payload: AdminLogin, db: Session = Depends(get_db)):
         .first()
     )
 
-    if not admin:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Credenziali admin non valide (email).",
-        )
+    # ✅ VERIFICA BCRYPT CORRETTA (sempre eseguita: con email
+    # sconosciuta verifica contro il dummy hash, risposta a tempo
+    # costante e dettaglio errore identico nei due casi)
+    hashed = admin.hashed_password if admin else _DUMMY_HASH
+    password_ok = pwd_context.verify(payload.password, hashed)
 
-    # ✅ VERIFICA BCRYPT CORRETTA
-    if not pwd_context.verify(payload.password, admin.hashed_password):
+    if not admin or not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Credenziali admin non valide (password).",
+            detail="Credenziali admin non valide.",
         )
 
     subject = f"admin:{admin.id}"
     access_token = create_access_token({"sub": subject})
 
+    # I valori arrivano da colonne già tipizzate: model_construct salta
+    # la ri-validazione pydantic sulla risposta di login
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "admin": AdminOut.model_validate(admin),
+        "admin": AdminOut.model_construct(
+            id=admin.id,
+            email=admin.email,
+            is_active=admin.is_active,
+            is_superadmin=admin.is_superadmin,
+        ),
     }
 
 
@@ -65,7 +78,22 @@ def get_current_admin(
         )
 
     admin_id = int(subject.split(":", 1)[1])
-    admin = db.query(Admin).filter(Admin.id == admin_id).first()
+
+    # Cache TTL 60s: senza, OGNI richiesta admin autenticata paga una
+    # SELECT solo per riconfermare l'admin. Cachiamo uno snapshot
+    # leggero (id/email/is_active), non l'istanza ORM legata alla
+    # session: a valle servono solo attributi in lettura.
+    def _load():
+        admin = db.get(Admin, admin_id)
+        if not admin:
+            return None
+        return SimpleNamespace(
+            id=admin.id,
+            email=admin.email,
+            is_active=admin.is_active,
+        )
+
+    admin = admin_auth_cache.get_or_set(admin_id, _load)
 
     if not admin:
         raise HTTPException(
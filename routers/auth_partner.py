@@ -11,19 +11,17 @@ router = APIRouter(prefix="/partner", tags=["Partner Auth"])
 
 @router.post("/login", response_model=TokenResponse)
 def partner_login(payload: PartnerLoginRequest, db: Session = Depends(get_db)):
-    partner = (
-        db.query(Partner)
-        .filter(
-            Partner.email == payload.email,
-            Partner.referral_code == payload.referral_code,
-            Partner.is_active == True,   # noqa: E712
-        )
+    # Lookup one-row sull'indice univoco di email, solo le colonne che
+    # servono; referral_code e is_active si confrontano in Python
+    row = (
+        db.query(Partner.id, Partner.referral_code, Partner.is_active)
+        .filter(Partner.email == payload.email)
         .first()
     )
 
-    if not partner:
+    if not row or row.referral_code != payload.referral_code or not row.is_active:
         raise HTTPException(status_code=401, detail="Credenziali partner non valide.")
 
-    access_token = create_access_token({"sub": str(partner.id)})
+    access_token = create_access_token({"sub": str(row.id)})
 
     return TokenResponse(access_token=access_token)
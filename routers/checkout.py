@@ -5,14 +5,22 @@ from __future__ import annotations
 import os
 import re
 from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from uuid import uuid4
 
+import logging
+from datetime import datetime, timezone
+
+import requests
 import stripe
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, EmailStr, AnyHttpUrl
-from typing import Optional, Literal, Dict, Any, Tuple
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Annotated, Optional, Literal, Dict, Any, Tuple, Union
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 
+from app.cache import checkout_amounts_cache, package_id_cache, package_price_cache
 from app.db import get_db
 from app.email_service import send_order_received_email
 from models.orders import Order, OrderType, PaymentMethod, PaymentStatus
@@ -24,13 +32,57 @@ try:
 except Exception:  # pragma: no cover
     Package = None  # type: ignore
 
+# Schema packages risolto UNA volta a import time: lo schema non cambia
+# a processo avviato, inutile ripetere hasattr a ogni checkout
+_PKG_HAS_TYPE = Package is not None and hasattr(Package, "package_type")
+_PKG_HAS_NUM_LICENSES = Package is not None and hasattr(Package, "num_licenses")
+_PKG_HAS_IS_ACTIVE = Package is not None and hasattr(Package, "is_active")
+_PKG_HAS_MAX_GUESTS = Package is not None and hasattr(Package, "max_guests")
+
+# Le sole colonne che servono all'endpoint Stripe session (le altre
+# restano deferred, niente idratazione inutile)
+_STRIPE_ORDER_LOAD = (
+    load_only(
+        Order.id,
+        Order.payment_status,
+        Order.payment_method,
+        Order.total_amount,
+        Order.buyer_email,
+        Order.stripe_session_id,
+        Order.stripe_session_expires_at,
+        Order.stripe_checkout_url,
+    ),
+)
+
 router = APIRouter(prefix="/checkout", tags=["Checkout"])
 
-InvoiceMode = Literal["PERSON_IT", "VAT_IT", "COMPANY_EXT"]
+logger = logging.getLogger(__name__)
+
+
+def _send_order_email_safe(**kwargs) -> None:
+    """Adapter per BackgroundTasks: logga il fallimento senza propagare."""
+    try:
+        send_order_received_email(**kwargs)
+    except Exception as e:
+        logger.warning(
+            "Order received email failed for %s: %s", kwargs.get("to_email"), str(e)
+        )
 
 SUPPORTED_LANGS = {"it", "en", "es", "fr", "de"}
 SITE_URL = "https://voiceguideapp.com"  # dominio pubblico del sito
 
+# Host accettati per i redirect success/cancel custom (allow-list,
+# estendibile via env CHECKOUT_REDIRECT_HOSTS="a.com,b.com").
+# URL fuori lista → si ricade sul default SITE_URL.
+_ALLOWED_REDIRECT_HOSTS = frozenset(
+    h.strip().lower()
+    for h in os.getenv(
+        "CHECKOUT_REDIRECT_HOSTS",
+        "voiceguideapp.com,www.voiceguideapp.com,localhost",
+    ).split(",")
+    if h.strip()
+)
+
 # -------------------------------------------------
 # Stripe config
 # -------------------------------------------------
@@ -40,11 +92,40 @@ STRIPE_CURRENCY = os.getenv("STRIPE_CURRENCY", "eur").strip().lower()
 if STRIPE_SECRET_KEY:
     stripe.api_key = STRIPE_SECRET_KEY
 
+# Session HTTP condivisa per le chiamate Stripe: keep-alive e pool di
+# connessioni tra i worker thread, così l'handshake TCP+TLS si paga una
+# volta e non a ogni checkout (stesso pattern della Session AirLink in
+# admin_licenses). Il client HTTP/2 del SDK è solo async, fuori dallo
+# stack sync di questa app.
+_stripe_http_session = requests.Session()
+_stripe_http_session.mount(
+    "https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+)
+stripe.default_http_client = stripe.RequestsClient(session=_stripe_http_session)
+
+
+def _make_line_item(title: str, amount_cents: int) -> Dict[str, Any]:
+    """Line item Stripe con currency già legata (struttura fissa)."""
+    return {
+        "price_data": {
+            "currency": STRIPE_CURRENCY,
+            "product_data": {"name": title},
+            "unit_amount": amount_cents,
+        },
+        "quantity": 1,
+    }
+
 
 # -----------------------------
 # Pydantic models (site payload)
 # -----------------------------
-class Address(BaseModel):
+# strip whitespace in pydantic-core (Rust) al parsing, invece di
+# .strip() sparsi negli handler; extra ignorati senza costo
+class _CheckoutModel(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, extra="ignore")
+
+
+class Address(_CheckoutModel):
     line: str
     city: str
     zip: str
@@ -52,43 +133,102 @@ class Address(BaseModel):
     country: str
 
 
-class Invoice(BaseModel):
-    mode: InvoiceMode
-    person_it: Optional[Dict[str, Any]] = None
-    vat_it: Optional[Dict[str, Any]] = None
-    company_ext: Optional[Dict[str, Any]] = None
+# Dettagli fattura tipizzati: pydantic valida (e strippa) i campi del
+# ramo giusto in Rust, selezionato dal discriminatore "mode"
+class PersonItDetails(_CheckoutModel):
+    full_name: Optional[str] = None
+    cf: Optional[str] = None
+
+
+class VatItDetails(_CheckoutModel):
+    company: Optional[str] = None
+    vat: Optional[str] = None
+    sdi: Optional[str] = None
+    pec: Optional[str] = None
+
+
+class CompanyExtDetails(_CheckoutModel):
+    company: Optional[str] = None
+    vat_or_tax_id: Optional[str] = None
+    country: Optional[str] = None
+
+
+class PersonItInvoice(_CheckoutModel):
+    mode: Literal["PERSON_IT"]
+    person_it: Optional[PersonItDetails] = None
+    address: Address
+
+
+class VatItInvoice(_CheckoutModel):
+    mode: Literal["VAT_IT"]
+    vat_it: Optional[VatItDetails] = None
+    address: Address
+
+
+class CompanyExtInvoice(_CheckoutModel):
+    mode: Literal["COMPANY_EXT"]
+    company_ext: Optional[CompanyExtDetails] = None
     address: Address
 
 
-class Customer(BaseModel):
+Invoice = Annotated[
+    Union[PersonItInvoice, VatItInvoice, CompanyExtInvoice],
+    Field(discriminator="mode"),
+]
+
+
+class Customer(_CheckoutModel):
     email: EmailStr
     whatsapp: Optional[str] = None
     partner_code: Optional[str] = None
 
 
-class CheckoutIntent(BaseModel):
+class CheckoutIntent(_CheckoutModel):
     product: str
     customer: Customer
     invoice: Optional[Invoice] = None
 
     # ✅ i18n + redirect (retrocompatibili)
+    # str semplici: il controllo è l'allow-list host, non il parsing
+    # AnyHttpUrl per richiesta
     lang: Optional[str] = "it"
-    success_url: Optional[AnyHttpUrl] = None
-    cancel_url: Optional[AnyHttpUrl] = None
+    success_url: Optional[str] = None
+    cancel_url: Optional[str] = None
 
 
-class StripeSessionIn(BaseModel):
+class StripeSessionIn(_CheckoutModel):
     order_id: int
     lang: Optional[str] = "it"
-    success_url: Optional[AnyHttpUrl] = None
-    cancel_url: Optional[AnyHttpUrl] = None
+    success_url: Optional[str] = None
+    cancel_url: Optional[str] = None
+
+
+# Mappa precomputata lower/upper → lingua: il caso tipico diventa un
+# singolo dict lookup senza .lower() per chiamata
+_LANG_MAP = {v: v for v in SUPPORTED_LANGS}
+_LANG_MAP.update({v.upper(): v for v in SUPPORTED_LANGS})
 
 
 def _normalize_lang(lang: Optional[str]) -> str:
-    v = (lang or "it").lower().strip()
-    return v if v in SUPPORTED_LANGS else "it"
+    if not lang:
+        return "it"
+    hit = _LANG_MAP.get(lang)
+    if hit is not None:
+        return hit
+    return _LANG_MAP.get(lang.strip().lower(), "it")
+
 
+# Pattern dei product code compilati una volta: niente lookup nella
+# cache interna di re a ogni normalizzazione
+_RE_UNDERSCORES = re.compile(r"_+")
+_RE_SINGLE = re.compile(r"SINGLE(\d+)")
+_RE_PKG_TO = re.compile(r"PACKAGE_TO(\d+)")
+_RE_PKG_SCHOOL = re.compile(r"PACKAGE_SCHOOL(\d+)")
 
+
+# I product code reali sono un insieme piccolo ed enumerabile: dopo il
+# primo passaggio la normalizzazione è un hit di cache
+@lru_cache(maxsize=128)
 def _normalize_product_code(raw: Optional[str]) -> str:
     """
     Normalizza product code proveniente dal sito.
@@ -106,7 +246,7 @@ def _normalize_product_code(raw: Optional[str]) -> str:
         return ""
     s = str(raw).strip()
     s = s.replace("-", "_").replace(" ", "_")
-    s = re.sub(r"_+", "_", s)
+    s = _RE_UNDERSCORES.sub("_", s)
     s = s.strip("_")
     s = s.upper()
 
@@ -117,104 +257,174 @@ def _normalize_product_code(raw: Optional[str]) -> str:
         s = "PACKAGE_" + s[len("PACK_") :]
 
     # gestioni "SINGLE10" / "PACKAGE_TO10" ecc.
-    m = re.fullmatch(r"SINGLE(\d+)", s)
+    m = _RE_SINGLE.fullmatch(s)
     if m:
         s = f"SINGLE_{m.group(1)}"
 
-    m = re.fullmatch(r"PACKAGE_TO(\d+)", s)
+    m = _RE_PKG_TO.fullmatch(s)
     if m:
         s = f"PACKAGE_TO_{m.group(1)}"
 
-    m = re.fullmatch(r"PACKAGE_SCHOOL(\d+)", s)
+    m = _RE_PKG_SCHOOL.fullmatch(s)
     if m:
         s = f"PACKAGE_SCHOOL_{m.group(1)}"
 
     return s
 
 
+# Filtro alpha-only compilato una volta (scan C-level, niente loop
+# Python per carattere)
+_NON_ALPHA_RE = re.compile(r"[^A-Za-z]")
+_ALPHA_RE = re.compile(r"[A-Za-z]+")
+
+
 def _normalize_country_iso2(raw: Optional[str], fallback: Optional[str] = None) -> Optional[str]:
-    if raw is None:
-        return fallback
-    s = str(raw).strip()
-    if not s:
+    # raw arriva già strippato dai model pydantic
+    if not raw:
         return fallback
-    s2 = "".join([c for c in s if c.isalpha()])
+    s = raw
+    # fast-path: input già tutto alfabetico ("IT", "it", "Italy") →
+    # un fullmatch, niente sub con ricostruzione stringa
+    if _ALPHA_RE.fullmatch(s):
+        s2 = s
+    else:
+        s2 = _NON_ALPHA_RE.sub("", s)
     if len(s2) < 2:
         return fallback
     return s2[:2].upper()
 
 
-def _build_checkout_success_url(order_id: int, lang: str, success_url: Optional[AnyHttpUrl]) -> str:
-    if success_url:
-        base_success = str(success_url)
-        sep = "&" if "?" in base_success else "?"
-        return f"{base_success}{sep}order={order_id}"
-    return f"{SITE_URL}/{lang}/checkout-success?order={order_id}"
+def _append_query(url: str, params: Dict[str, str], safe: str = "") -> str:
+    """
+    Aggiunge parametri alla query string in un passaggio solo,
+    preservando query esistente e fragment (un "&" appeso a mano
+    finirebbe dopo un eventuale #fragment).
+    """
+    parts = urlsplit(url)
+    q = parse_qsl(parts.query, keep_blank_values=True)
+    q.extend(params.items())
+    return urlunsplit(parts._replace(query=urlencode(q, safe=safe)))
+
+
+def _validate_redirect_url(url: Optional[str]) -> Optional[str]:
+    """Ritorna l'URL solo se https/http verso un host in allow-list."""
+    if not url:
+        return None
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    if parts.scheme not in ("https", "http"):
+        return None
+    if (parts.hostname or "").lower() not in _ALLOWED_REDIRECT_HOSTS:
+        return None
+    return url
+
+
+# Prefissi default precomputati per lingua: il caso tipico (nessun
+# redirect custom) diventa prefisso + order_id, senza format né check
+# separatore per chiamata
+_SUCCESS_URL_PREFIX = {
+    lang: f"{SITE_URL}/{lang}/checkout-success?order=" for lang in SUPPORTED_LANGS
+}
+_CANCEL_URL_PREFIX = {
+    lang: f"{SITE_URL}/{lang}/checkout?order=" for lang in SUPPORTED_LANGS
+}
+
+
+def _build_checkout_success_url(order_id: int, lang: str, success_url: Optional[str]) -> str:
+    base_success = _validate_redirect_url(success_url)
+    if base_success:
+        return _append_query(base_success, {"order": str(order_id)})
+    return _SUCCESS_URL_PREFIX[lang] + str(order_id)
+
+
+def _build_checkout_cancel_url(order_id: int, lang: str, cancel_url: Optional[str]) -> str:
+    base_cancel = _validate_redirect_url(cancel_url)
+    if base_cancel:
+        return _append_query(base_cancel, {"order": str(order_id)})
+    return _CANCEL_URL_PREFIX[lang] + str(order_id)
+
+
+# Estrattori per modalità fattura: ognuno ritorna
+# (country, company_name, vat_number, tax_code, pec, sdi_code).
+# I campi arrivano già strippati dai submodel tipizzati: qui resta
+# solo la coalescenza vuoto → None
+def _extract_person_it(invoice: PersonItInvoice) -> Tuple[Optional[str], ...]:
+    person = invoice.person_it
+    if person is None:
+        return ("IT", None, None, None, None, None)
+    return ("IT", person.full_name or None, None, person.cf or None, None, None)
+
+
+def _extract_vat_it(invoice: VatItInvoice) -> Tuple[Optional[str], ...]:
+    vat = invoice.vat_it
+    if vat is None:
+        return ("IT", None, None, None, None, None)
+    return (
+        "IT",
+        vat.company or None,
+        vat.vat or None,
+        None,
+        vat.pec or None,
+        vat.sdi or None,
+    )
+
+
+def _extract_company_ext(invoice: CompanyExtInvoice) -> Tuple[Optional[str], ...]:
+    ext = invoice.company_ext
+    if ext is None:
+        return (None, None, None, None, None, None)
+    country = _normalize_country_iso2(ext.country)
+    return (country, ext.company or None, ext.vat_or_tax_id or None, None, None, None)
 
 
-def _build_checkout_cancel_url(order_id: int, lang: str, cancel_url: Optional[AnyHttpUrl]) -> str:
-    if cancel_url:
-        base_cancel = str(cancel_url)
-        sep = "&" if "?" in base_cancel else "?"
-        return f"{base_cancel}{sep}order={order_id}"
-    return f"{SITE_URL}/{lang}/checkout?order={order_id}"
+_INVOICE_DISPATCH = {
+    "PERSON_IT": _extract_person_it,
+    "VAT_IT": _extract_vat_it,
+    "COMPANY_EXT": _extract_company_ext,
+}
 
 
-def _save_billing_from_invoice(db: Session, order_id: int, invoice: Invoice) -> None:
+def _billing_from_invoice(invoice: Invoice) -> Optional[OrderBillingDetails]:
+    """
+    Costruisce il record billing dal payload invoice. L'FK su order la
+    risolve la relationship: order + billing partono in un unico flush
+    al commit, senza flush intermedio.
+    """
     if not invoice:
-        return
+        return None
 
-    mode = invoice.mode
     addr = invoice.address
 
-    request_invoice = True
-
-    country = None
-    company_name = None
-    vat_number = None
-    tax_code = None
-    pec = None
-    sdi_code = None
-
-    if mode == "PERSON_IT":
-        country = "IT"
-        person = invoice.person_it or {}
-        company_name = (person.get("full_name") or "").strip() or None
-        tax_code = (person.get("cf") or "").strip() or None
-
-    elif mode == "VAT_IT":
-        country = "IT"
-        vat = invoice.vat_it or {}
-        company_name = (vat.get("company") or "").strip() or None
-        vat_number = (vat.get("vat") or "").strip() or None
-        sdi_code = (vat.get("sdi") or "").strip() or None
-        pec = (vat.get("pec") or "").strip() or None
-
-    elif mode == "COMPANY_EXT":
-        ext = invoice.company_ext or {}
-        company_name = (ext.get("company") or "").strip() or None
-        vat_number = (ext.get("vat_or_tax_id") or "").strip() or None
-        country = _normalize_country_iso2(ext.get("country"))
-
-    bd = OrderBillingDetails(
-        order_id=order_id,
-        request_invoice=request_invoice,
+    # Dispatch per mode: un dict lookup invece della cascata if/elif
+    country, company_name, vat_number, tax_code, pec, sdi_code = _INVOICE_DISPATCH[
+        invoice.mode
+    ](invoice)
+
+    return OrderBillingDetails(
+        request_invoice=True,
         country=country,
         company_name=company_name,
         vat_number=vat_number,
         tax_code=tax_code,
-        address=addr.line.strip() if addr.line else None,
-        city=addr.city.strip() if addr.city else None,
-        zip_code=addr.zip.strip() if addr.zip else None,
-        province=addr.province.strip() if addr.province else None,
+        address=addr.line or None,
+        city=addr.city or None,
+        zip_code=addr.zip or None,
+        province=addr.province or None,
         pec=pec,
         sdi_code=sdi_code,
     )
-    db.add(bd)
+
+
+# Costruire Decimal da stringa parsa e normalizza a ogni chiamata:
+# le costanti monetarie stanno a livello modulo
+_CENT = Decimal("0.01")
+_ZERO = Decimal("0.00")
 
 
 def _money2(value: Decimal) -> Decimal:
-    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
 
 
 def _eur_to_cents(amount_eur: Decimal) -> int:
@@ -238,32 +448,43 @@ def _resolve_single_package_id(db: Session, max_guests: int) -> int:
       - num_licenses == 1
       - is_active == True (se presente)
       - max_guests == X
+
+    Il catalogo è piccolo e quasi statico: l'id risolto resta in cache
+    TTL, così il checkout ripetuto sullo stesso prodotto non paga la
+    SELECT.
     """
+    return package_id_cache.get_or_set(
+        ("SINGLE", max_guests), lambda: _query_single_package_id(db, max_guests)
+    )
+
+
+def _query_single_package_id(db: Session, max_guests: int) -> int:
     _require_package_model()
 
     q = db.query(Package)
 
-    if hasattr(Package, "package_type"):
-        q = q.filter(getattr(Package, "package_type") == "SINGLE")
+    if _PKG_HAS_TYPE:
+        q = q.filter(Package.package_type == "SINGLE")
 
-    if hasattr(Package, "num_licenses"):
-        q = q.filter(getattr(Package, "num_licenses") == 1)
+    if _PKG_HAS_NUM_LICENSES:
+        q = q.filter(Package.num_licenses == 1)
 
-    if hasattr(Package, "is_active"):
-        q = q.filter(getattr(Package, "is_active") == True)  # noqa
+    if _PKG_HAS_IS_ACTIVE:
+        q = q.filter(Package.is_active == True)  # noqa
 
-    if hasattr(Package, "max_guests"):
-        q = q.filter(getattr(Package, "max_guests") == max_guests)
+    if _PKG_HAS_MAX_GUESTS:
+        q = q.filter(Package.max_guests == max_guests)
     else:
         raise HTTPException(status_code=500, detail="packages missing max_guests column.")
 
-    row = q.first()
-    if not row:
+    # Solo id: niente idratazione ORM della riga intera
+    pid = q.with_entities(Package.id).scalar()
+    if pid is None:
         raise HTTPException(
             status_code=500,
             detail=f"Missing packages row for SINGLE_{max_guests} (package_type=SINGLE, num_licenses=1).",
         )
-    return int(getattr(row, "id"))
+    return int(pid)
 
 
 def _resolve_package_id_by_type_and_num_licenses(db: Session, package_type: str, num_licenses: int) -> int:
@@ -277,24 +498,25 @@ def _resolve_package_id_by_type_and_num_licenses(db: Session, package_type: str,
 
     q = db.query(Package)
 
-    if hasattr(Package, "package_type"):
-        q = q.filter(getattr(Package, "package_type") == package_type)
+    if _PKG_HAS_TYPE:
+        q = q.filter(Package.package_type == package_type)
 
-    if hasattr(Package, "num_licenses"):
-        q = q.filter(getattr(Package, "num_licenses") == int(num_licenses))
+    if _PKG_HAS_NUM_LICENSES:
+        q = q.filter(Package.num_licenses == int(num_licenses))
     else:
         raise HTTPException(status_code=500, detail="packages missing num_licenses column.")
 
-    if hasattr(Package, "is_active"):
-        q = q.filter(getattr(Package, "is_active") == True)  # noqa
+    if _PKG_HAS_IS_ACTIVE:
+        q = q.filter(Package.is_active == True)  # noqa
 
-    row = q.first()
-    if not row:
+    # Solo id: niente idratazione ORM della riga intera
+    pid = q.with_entities(Package.id).scalar()
+    if pid is None:
         raise HTTPException(
             status_code=500,
             detail=f"Missing packages row for {package_type} num_licenses={num_licenses}.",
         )
-    return int(getattr(row, "id"))
+    return int(pid)
 
 
 def _load_package(db: Session, package_id: int) -> Any:
@@ -302,7 +524,7 @@ def _load_package(db: Session, package_id: int) -> Any:
     row = db.query(Package).filter(getattr(Package, "id") == int(package_id)).first()
     if not row:
         raise HTTPException(status_code=500, detail=f"Package not found (id={package_id}).")
-    if hasattr(row, "is_active") and row.is_active is False:
+    if _PKG_HAS_IS_ACTIVE and row.is_active is False:
         raise HTTPException(status_code=500, detail=f"Package id={package_id} is not active.")
     return row
 
@@ -314,23 +536,59 @@ def _calc_amounts_from_db(
     Prezzi = SEMPRE dal DB (packages.price).
     units = quantità di pacchetti acquistati (di solito 1).
     """
-    pkg = _load_package(db, package_id)
+    # partner_code è già strippato (e coalescato a None) dal chiamante
+    has_partner = bool(partner_code)
+
+    # LUT degli esiti: (package_id, units, has_partner) copre l'intero
+    # spazio di input reale (pochi SKU × 2 stati sconto), la tupla
+    # finale arriva dalla cache senza query né aritmetica
+    return checkout_amounts_cache.get_or_set(
+        (package_id, int(units), has_partner),
+        lambda: _compute_amounts(db, package_id, units, has_partner),
+    )
 
-    try:
-        unit_price = Decimal(str(getattr(pkg, "price")))
-    except Exception:
-        raise HTTPException(status_code=500, detail=f"Invalid packages.price for id={package_id}")
 
-    subtotal = _money2(unit_price * Decimal(int(units)))
+def _compute_amounts(
+    db: Session, package_id: int, units: int, has_partner: bool
+) -> Tuple[Decimal, Decimal, Decimal]:
+    # Prezzo in cache TTL (in centesimi interi): i prezzi di listino
+    # cambiano di rado, il checkout ripetuto sullo stesso pacchetto
+    # salta la SELECT
+    def _load_price_cents() -> int:
+        pkg = _load_package(db, package_id)
+        try:
+            return _eur_to_cents(Decimal(str(getattr(pkg, "price"))))
+        except HTTPException:
+            raise
+        except Exception:
+            raise HTTPException(status_code=500, detail=f"Invalid packages.price for id={package_id}")
 
-    discount_rate = Decimal("0.05") if (partner_code and str(partner_code).strip()) else Decimal("0.00")
-    discount = _money2(subtotal * discount_rate)
-    total = _money2(subtotal - discount)
+    unit_cents = package_price_cache.get_or_set(package_id, _load_price_cents)
 
-    if total <= Decimal("0.00"):
+    # Aritmetica in centesimi interi (sconto 5% half-up), Decimal solo
+    # sul risultato: niente quantize intermedi per richiesta
+    subtotal_cents = unit_cents * int(units)
+    discount_cents = (subtotal_cents * 5 + 50) // 100 if has_partner else 0
+    total_cents = subtotal_cents - discount_cents
+
+    if total_cents <= 0:
         raise HTTPException(status_code=400, detail="Total amount must be > 0")
 
-    return subtotal, discount, total
+    return (
+        subtotal_cents * _CENT,
+        discount_cents * _CENT,
+        total_cents * _CENT,
+    )
+
+
+# Dispatch prefisso → (order_type, package_type): un rpartition + un
+# dict lookup al posto della cascata di startswith/split/try-except.
+# package_type None = SINGLE (il suffisso è max_guests, non num_licenses)
+_PRODUCT_PREFIX_DISPATCH = {
+    "SINGLE": (OrderType.SINGLE, None),
+    "PACKAGE_TO": (OrderType.PACKAGE_TO, "TO"),
+    "PACKAGE_SCHOOL": (OrderType.PACKAGE_SCHOOL, "SCHOOL"),
+}
 
 
 def _parse_product_to_order_fields(db: Session, product: str) -> Tuple[OrderType, int, int]:
@@ -343,34 +601,21 @@ def _parse_product_to_order_fields(db: Session, product: str) -> Tuple[OrderType
     """
     prod = _normalize_product_code(product)
 
-    if prod.startswith("SINGLE_"):
-        try:
-            mg = int(prod.split("_", 1)[1])
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid product SINGLE_x")
-
-        package_id = _resolve_single_package_id(db, max_guests=mg)
-        return (OrderType.SINGLE, package_id, 1)
-
-    if prod.startswith("PACKAGE_TO_"):
-        try:
-            nl = int(prod.split("_")[-1])
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid product PACKAGE_TO_x")
+    prefix, _, suffix = prod.rpartition("_")
+    entry = _PRODUCT_PREFIX_DISPATCH.get(prefix)
+    if entry is None or not suffix.isdigit():
+        raise HTTPException(status_code=400, detail=f"Invalid product: {product}")
 
-        package_id = _resolve_package_id_by_type_and_num_licenses(db, package_type="TO", num_licenses=nl)
-        return (OrderType.PACKAGE_TO, package_id, 1)
+    order_type, package_type = entry
+    n = int(suffix)
 
-    if prod.startswith("PACKAGE_SCHOOL_"):
-        try:
-            nl = int(prod.split("_")[-1])
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid product PACKAGE_SCHOOL_x")
-
-        package_id = _resolve_package_id_by_type_and_num_licenses(db, package_type="SCHOOL", num_licenses=nl)
-        return (OrderType.PACKAGE_SCHOOL, package_id, 1)
-
-    raise HTTPException(status_code=400, detail=f"Invalid product: {product}")
+    if package_type is None:
+        package_id = _resolve_single_package_id(db, max_guests=n)
+    else:
+        package_id = _resolve_package_id_by_type_and_num_licenses(
+            db, package_type=package_type, num_licenses=n
+        )
+    return (order_type, package_id, 1)
 
 
 # -------------------------------------------------
@@ -384,7 +629,6 @@ def create_checkout_intent(data: CheckoutIntent):
     lang = _normalize_lang(data.lang)
     discount = 0.05 if data.customer.partner_code else 0.0
 
-    from uuid import uuid4
     order_id = str(uuid4())
 
     checkout_url = _build_checkout_success_url(order_id=order_id, lang=lang, success_url=data.success_url)  # type: ignore[arg-type]
@@ -400,7 +644,11 @@ def create_checkout_intent(data: CheckoutIntent):
 # POST /checkout/create-order  ✅ ordine reale (PENDING)
 # -------------------------------------------------
 @router.post("/create-order")
-def create_order_real(data: CheckoutIntent, db: Session = Depends(get_db)):
+def create_order_real(
+    data: CheckoutIntent,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
     if not data.product:
         raise HTTPException(status_code=400, detail="Invalid product")
 
@@ -412,24 +660,30 @@ def create_order_real(data: CheckoutIntent, db: Session = Depends(get_db)):
 
     order_type, package_id, quantity = _parse_product_to_order_fields(db, resolved_product)
 
+    # Già strippati da pydantic al parsing; qui solo la coalescenza a None
+    partner_code = data.customer.partner_code or None
+    whatsapp = data.customer.whatsapp or None
+
     subtotal, discount, total = _calc_amounts_from_db(
         db=db,
         package_id=package_id,
         units=quantity,
-        partner_code=data.customer.partner_code,
+        partner_code=partner_code,
     )
 
     order = Order(
-        buyer_email=data.customer.email.strip(),
-        buyer_whatsapp=(data.customer.whatsapp.strip() if data.customer.whatsapp else None),
+        buyer_email=data.customer.email,
+        buyer_whatsapp=whatsapp,
 
         order_type=order_type,
         package_id=package_id,
         quantity=quantity,
 
-        subtotal_amount=float(subtotal),
-        discount_amount=float(discount),
-        total_amount=float(total),
+        # Colonne Numeric(10,2): i Decimal passano diretti, senza
+        # round-trip float
+        subtotal_amount=subtotal,
+        discount_amount=discount,
+        total_amount=total,
 
         estimated_agora_cost=None,
 
@@ -437,33 +691,26 @@ def create_order_real(data: CheckoutIntent, db: Session = Depends(get_db)):
         payment_status=PaymentStatus.PENDING,
 
         partner_id=None,
-        referral_code=(data.customer.partner_code.strip() if data.customer.partner_code else None),
+        referral_code=partner_code,
     )
 
-    db.add(order)
-    db.flush()
-
     if data.invoice is not None:
-        _save_billing_from_invoice(db, order_id=order.id, invoice=data.invoice)
+        order.billing_details = _billing_from_invoice(data.invoice)
 
+    db.add(order)
     db.commit()
     db.refresh(order)
 
-    # Email "Order received" (best effort)
-    try:
-        bd = getattr(order, "billing_details", None)
-        invoice_requested = bool(getattr(bd, "request_invoice", False)) if bd else False
-        intestatario = getattr(bd, "company_name", None) if bd else None
-
-        send_order_received_email(
-            to_email=order.buyer_email,
-            order_id=order.id,
-            product=resolved_product,
-            invoice_requested=invoice_requested,
-            intestatario=intestatario,
-        )
-    except Exception:
-        pass
+    # Email "Order received" NON BLOCCANTE: parte dopo la risposta
+    bd = order.billing_details
+    background_tasks.add_task(
+        _send_order_email_safe,
+        to_email=order.buyer_email,
+        order_id=order.id,
+        product=resolved_product,
+        invoice_requested=bool(bd.request_invoice) if bd else False,
+        intestatario=bd.company_name if bd else None,
+    )
 
     checkout_url = _build_checkout_success_url(order_id=order.id, lang=lang, success_url=data.success_url)
 
@@ -487,19 +734,50 @@ def create_stripe_checkout_session(payload: StripeSessionIn, db: Session = Depen
 
     lang = _normalize_lang(payload.lang)
 
-    order = db.query(Order).filter(Order.id == payload.order_id).first()
+    # Lookup per PK: passa dall'identity map e salta la compilazione
+    # della Query; carica solo le colonne usate qui
+    order = db.get(Order, payload.order_id, options=_STRIPE_ORDER_LOAD)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
     if order.payment_status == PaymentStatus.PAID:
         raise HTTPException(status_code=400, detail="Order already paid")
 
-    try:
-        total_eur = Decimal(str(order.total_amount))
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid order amount")
-
-    if total_eur <= Decimal("0.00"):
+    # Session già creata e non scaduta → riusala (niente nuova session
+    # per ogni refresh della pagina checkout)
+    if (
+        order.stripe_session_id
+        and order.stripe_session_expires_at is not None
+        and order.stripe_session_expires_at > datetime.now(timezone.utc)
+    ):
+        # URL già persistito → risposta diretta dal DB, zero chiamate
+        # verso Stripe
+        if order.stripe_checkout_url:
+            return {
+                "order_id": order.id,
+                "stripe_session_id": order.stripe_session_id,
+                "checkout_url": order.stripe_checkout_url,
+            }
+        try:
+            existing = stripe.checkout.Session.retrieve(order.stripe_session_id)
+            if existing.get("status") == "open" and existing.get("url"):
+                return {
+                    "order_id": order.id,
+                    "stripe_session_id": existing["id"],
+                    "checkout_url": existing["url"],
+                }
+        except Exception as e:
+            # session irrecuperabile → se ne crea una nuova sotto
+            logger.warning(
+                "Stripe session retrieve failed for order %s: %s", order.id, str(e)
+            )
+
+    # Colonna Numeric(10,2): il driver restituisce già Decimal esatti,
+    # niente round-trip via str; il cast resta solo per backend anomali
+    total = order.total_amount
+    total_eur = total if isinstance(total, Decimal) else Decimal(str(total))
+
+    if total_eur <= _ZERO:
         raise HTTPException(status_code=400, detail="Order total_amount must be > 0")
 
     amount_cents = _eur_to_cents(total_eur)
@@ -507,8 +785,10 @@ def create_stripe_checkout_session(payload: StripeSessionIn, db: Session = Depen
     success_url = _build_checkout_success_url(order_id=order.id, lang=lang, success_url=payload.success_url)
     cancel_url = _build_checkout_cancel_url(order_id=order.id, lang=lang, cancel_url=payload.cancel_url)
 
-    sep = "&" if "?" in success_url else "?"
-    success_url = f"{success_url}{sep}session_id={{CHECKOUT_SESSION_ID}}"
+    # safe="{}" lascia intatto il placeholder che Stripe sostituisce
+    success_url = _append_query(
+        success_url, {"session_id": "{CHECKOUT_SESSION_ID}"}, safe="{}"
+    )
 
     title = f"VoiceGuide License (Order #{order.id})"
 
@@ -517,37 +797,31 @@ def create_stripe_checkout_session(payload: StripeSessionIn, db: Session = Depen
             mode="payment",
             payment_method_types=["card"],
             customer_email=order.buyer_email,
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": STRIPE_CURRENCY,
-                        "product_data": {"name": title},
-                        "unit_amount": amount_cents,
-                    },
-                    "quantity": 1,
-                }
-            ],
+            line_items=[_make_line_item(title, amount_cents)],
             metadata={"order_id": str(order.id)},
             success_url=success_url,
             cancel_url=cancel_url,
+            # Doppio click / retry client: Stripe ritorna la stessa
+            # session invece di crearne una nuova (finestra 24h).
+            # amount e lang nella chiave: se l'ordine cambia, la
+            # richiesta non collide con la session precedente
+            idempotency_key=f"order-{order.id}-{amount_cents}-{lang}",
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Stripe error: {str(e)}")
 
-    try:
-        order.payment_method = PaymentMethod.STRIPE
-    except Exception:
-        pass
-
-    if hasattr(order, "stripe_session_id"):
-        try:
-            setattr(order, "stripe_session_id", session.id)
-        except Exception:
-            pass
+    # order è già tracciato dalla session: bastano gli assegnamenti e
+    # un commit (UPDATE solo delle colonne cambiate), niente
+    # re-add/refresh
+    order.payment_method = PaymentMethod.STRIPE
+    order.stripe_session_id = session.id
+    order.stripe_checkout_url = session.url
+    if getattr(session, "expires_at", None):
+        order.stripe_session_expires_at = datetime.fromtimestamp(
+            session.expires_at, tz=timezone.utc
+        )
 
-    db.add(order)
     db.commit()
-    db.refresh(order)
 
     return {
         "order_id": order.id,
@@ -4,6 +4,7 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr
+from sqlalchemy import exists
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
@@ -130,16 +131,14 @@ def create_partner_request(payload: dict, db: Session = Depends(get_db)):
     if not email:
         raise HTTPException(status_code=422, detail="Missing field: email")
 
-    # Anti-duplicati applicativo (se già pending)
-    existing = (
-        db.query(PartnerRequest)
-        .filter(
+    # Anti-duplicati applicativo (EXISTS: solo un booleano dal DB)
+    already_pending = db.query(
+        exists().where(
             PartnerRequest.email == email,
             PartnerRequest.status == PartnerRequestStatus.PENDING,
         )
-        .first()
-    )
-    if existing:
+    ).scalar()
+    if already_pending:
         raise HTTPException(
             status_code=409,
             detail="A request for this email is already pending.",
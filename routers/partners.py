@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import exists
 from sqlalchemy.orm import Session
 
 from app.db import get_db
@@ -11,14 +12,12 @@ router = APIRouter(prefix="/partners", tags=["Partners"])
 @router.post("/create", response_model=PartnerOut)
 def create_partner(payload: PartnerCreate, db: Session = Depends(get_db)):
 
-    # Controllo email duplicata
-    existing_email = db.query(Partner).filter(Partner.email == payload.email).first()
-    if existing_email:
+    # Controllo email duplicata (EXISTS: nessuna riga materializzata)
+    if db.query(exists().where(Partner.email == payload.email)).scalar():
         raise HTTPException(status_code=400, detail="Email già registrata come partner.")
 
     # Controllo referral duplicato
-    existing_ref = db.query(Partner).filter(Partner.referral_code == payload.referral_code).first()
-    if existing_ref:
+    if db.query(exists().where(Partner.referral_code == payload.referral_code)).scalar():
         raise HTTPException(status_code=400, detail="Referral code già in uso.")
 
     # Conversione partner type
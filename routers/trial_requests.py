@@ -5,6 +5,7 @@ from pydantic import BaseModel, EmailStr, Field
 from typing import Literal, Optional
 from datetime import datetime
 
+from app.cache import trial_requests_count_cache
 from app.db import SessionLocal
 from models.trial_requests import TrialRequest, TrialRequestStatus
 
@@ -41,6 +42,9 @@ def create_trial_request(payload: TrialRequestCreate):
         db.add(tr)
         db.commit()
         db.refresh(tr)
+
+        # Nuova PENDING → badge count admin non più valido
+        trial_requests_count_cache.invalidate()
         return tr
     except Exception:
         db.rollback()
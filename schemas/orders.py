@@ -1,8 +1,102 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, computed_field, model_validator
 from decimal import Decimal
-from typing import List
+from datetime import date, datetime
+from typing import List, Optional
 
 from schemas.billing import BillingDetailsCreate
+from models.orders import OrderType, PaymentMethod, PaymentStatus
+
+
+# --------- ADMIN REPORT (SERIALIZZAZIONE ORDINI) ---------
+
+
+class OrderBillingDetailsOut(BaseModel):
+    """Dettagli fatturazione 1:1 dell'ordine (per UI admin)."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    request_invoice: bool
+    country: Optional[str] = None
+    company_name: Optional[str] = None
+    vat_number: Optional[str] = None
+    tax_code: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    zip_code: Optional[str] = None
+    province: Optional[str] = None
+    pec: Optional[str] = None
+    sdi_code: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class OrderOut(BaseModel):
+    """
+    Riga ordine per il report admin.
+
+    Serializzazione via pydantic-core (from_attributes) invece della
+    costruzione manuale dict campo-per-campo: molto più veloce sulle liste.
+    """
+
+    model_config = ConfigDict(from_attributes=True, use_enum_values=True)
+
+    id: int
+    created_at: Optional[datetime] = None
+    buyer_email: str
+    buyer_whatsapp: Optional[str] = None
+    order_type: Optional[OrderType] = None
+    package_id: Optional[int] = None
+    quantity: int = 1
+    total_amount: float = 0.0
+    estimated_agora_cost: Optional[float] = None
+    payment_method: Optional[PaymentMethod] = None
+    payment_status: Optional[PaymentStatus] = None
+    partner_id: Optional[int] = None
+    referral_code: Optional[str] = None
+
+    # 1:1 fatturazione (None se non richiesta)
+    billing_details: Optional[OrderBillingDetailsOut] = None
+
+    @model_validator(mode="after")
+    def _hide_billing_if_not_requested(self):
+        # request_invoice=False → per l'admin equivale a "fattura non richiesta"
+        if self.billing_details is not None and not self.billing_details.request_invoice:
+            self.billing_details = None
+        return self
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def margin(self) -> Optional[float]:
+        if self.estimated_agora_cost is None:
+            return None
+        return self.total_amount - self.estimated_agora_cost
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def invoice_requested(self) -> bool:
+        return self.billing_details is not None
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def invoice_intestatario(self) -> Optional[str]:
+        return self.billing_details.company_name if self.billing_details else None
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def invoice_country(self) -> Optional[str]:
+        return self.billing_details.country if self.billing_details else None
+
+
+class OrdersReportOut(BaseModel):
+    """Risposta strutturata di GET /admin/orders."""
+
+    items: List[OrderOut]
+    total_count: int
+    from_date: Optional[date] = None
+    to_date: Optional[date] = None
+    total_amount: float = 0.0
+    total_estimated_agora_cost: float = 0.0
+    total_margin: float = 0.0
 
 
 # --------- SINGLE LICENSE (GUIDES) ---------
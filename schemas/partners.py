@@ -1,8 +1,8 @@
 # schemas/partners.py
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from decimal import Decimal
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 from datetime import datetime
 
@@ -23,6 +23,10 @@ class PartnerCreate(BaseModel):
 
 
 class PartnerOut(BaseModel):
+    # Pydantic v2: from_attributes → validazione diretta dalle righe ORM
+    # in pydantic-core, senza passare da dict intermedi
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     email: EmailStr
@@ -33,5 +37,9 @@ class PartnerOut(BaseModel):
     is_active: bool
     created_at: datetime | None = None
 
-    class Config:
-        from_attributes = True
+
+class PartnersPageOut(BaseModel):
+    """Pagina partner + totale (lista e count in un solo round-trip)."""
+
+    total: int
+    items: List[PartnerOut]